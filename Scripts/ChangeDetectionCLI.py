@@ -0,0 +1,234 @@
+# ChangeDetection toolbox
+# Headless command line interface and warm worker for all four tools
+# Lukas Zubrietovsky, Hana Bobalova
+
+# Usage:
+#   python ChangeDetectionCLI.py detect --inFC1 ... --outFC ...
+#   python ChangeDetectionCLI.py classify --inFC ... --outSumTable ...
+#   python ChangeDetectionCLI.py hierarchy --inFC ... --outSumTable ...
+#   python ChangeDetectionCLI.py statistics --inFC ... --outStatTable ...
+#   python ChangeDetectionCLI.py worker [--port 8765]
+#
+# In worker mode, one job per line is read either from stdin or from a local
+# socket, e.g.
+#   {"tool": "statistics", "params": {"inFC": "...", "fieldChange": "...", ...}}
+# and one result line is written back, e.g.
+#   {"tool": "statistics", "status": "OK", "seconds": 1.23}
+
+import argparse, json, sys, time
+
+
+areaUnits = ["Ares", "Hectares", "Square meters", "Square kilometers"]
+yesNo = ["YES", "NO"]
+
+# default values of optional YES/NO parameters
+defaults = {"noChange": "YES", "dissolve": "NO", "validate": "NO"}
+
+# tool name: (module, function, [(parameter, required, choices, help)])
+# parameters follow the order of the tool parameters in ChangeDetection.atbx,
+# parameters not present in the toolbox (e.g. dissolve, stateFile) are at the end;
+# tools 2-4 accept a change table folder (see ChangeTable.py) as inFC
+tools = {
+    "detect": ("Tool1_DetectionOfChanges", "detectChanges", [
+        ("inFC1", True, None, "input LC feature class from the first period"),
+        ("fieldCode1", True, None, "input field with LC codes from the first period"),
+        ("inFC2", True, None, "input LC feature class from the second period"),
+        ("fieldCode2", True, None, "input field with LC codes from the second period"),
+        ("fieldChange", True, None, "new change code field"),
+        ("fieldArea", True, None, "new area field"),
+        ("areaUnit", True, areaUnits, "output area unit"),
+        ("noChange", False, yesNo, "include areas without change in output feature class"),
+        ("minArea", False, None, "minimal area to exclude minor changes from the output feature class"),
+        ("outFC", True, None, "output LC change feature class"),
+        ("outConTable", False, None, "output contingency table (xls)"),
+        ("outSumTable", False, None, "output summary table (xls)"),
+        ("dissolve", False, yesNo, "dissolve adjacent features with the same change code"),
+        ("validate", False, yesNo, "validate input layers before overlay"),
+        ("stateFile", False, None, "state of the previous run (json) for incremental detection of changes"),
+        ("outColumns", False, None, "output folder of columnar change table for tools 2-4"),
+        ("fieldZone", False, None, "zone field exported to the change table"),
+        ("tolerance", False, None, "area of overlaps and gaps ignored by validation (default minArea)")]),
+    "classify": ("Tool2_ClassificationOfChanges", "classifyChanges", [
+        ("inFC", True, None, "input feature class of LC changes"),
+        ("fieldChange", True, None, "field with change codes"),
+        ("fieldArea", True, None, "area field"),
+        ("areaUnit", True, areaUnits, "area unit"),
+        ("fieldType", True, None, "new field with type of change"),
+        ("inConTable", True, None, "input conversion table"),
+        ("tabFieldChange", True, None, "field with change codes in conversion table"),
+        ("tabFieldType", True, None, "field with type of change in conversion table"),
+        ("noChange", False, yesNo, "include areas without change in output statistics"),
+        ("outSumTable", True, None, "output summary table"),
+        ("outGraphAbs", False, None, "output graph of absolute area proportions of change types"),
+        ("outGraphRel", False, None, "output graph of relative area proportions of change types")]),
+    "hierarchy": ("Tool3_HierarchyOfChanges", "detectHierarchy", [
+        ("inFC", True, None, "input feature class of LC changes"),
+        ("fieldChange", True, None, "field with change codes"),
+        ("fieldArea", True, None, "area field"),
+        ("areaUnit", True, areaUnits, "area unit"),
+        ("fieldHL", True, None, "new field with hierarchy levels"),
+        ("noChange", False, yesNo, "include areas without change in output statistics"),
+        ("outSumTable", True, None, "output summary table"),
+        ("outGraphAbs", False, None, "output graph of absolute area proportions of hierarchy levels"),
+        ("outGraphRel", False, None, "output graph of relative area proportions of hierarchy levels")]),
+    "statistics": ("Tool4_StatisticalEvaluationOfChanges", "computeStatistics", [
+        ("inFC", True, None, "input feature class of LC changes"),
+        ("fieldChange", True, None, "field with change codes"),
+        ("fieldArea", True, None, "area field"),
+        ("areaUnit", True, areaUnits, "area unit"),
+        ("codeLC", False, None, "code of LC category"),
+        ("outStatTable", True, None, "output statistical table"),
+        ("outGraphNet", False, None, "output graph of net change"),
+        ("outGraphGL", False, None, "output graph of gains and losses"),
+        ("outGraphCon", False, None, "output graph of contributors to net change"),
+        ("replicates", False, None, "number of bootstrap replicates for confidence intervals"),
+        ("confidence", False, None, "confidence level of intervals in percent (default 95)"),
+        ("inMisclassTable", False, None, "misclassification table (mapped code, true code, probability)")]),
+}
+
+
+def warmUp():
+
+    ''' Imports the heavy modules used by the tools once, so that following
+        jobs find them already loaded. '''
+
+    import arcpy, xlwt
+    import numpy
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot
+
+    import importlib
+    for module, function, params in tools.values():
+        importlib.import_module(module)
+
+
+def runTool(tool, params):
+
+    ''' Runs one tool with parameters given as a dictionary. Optional parameters
+        which are not given are passed as empty strings, the same as an empty
+        tool parameter in ArcGIS. '''
+
+    import importlib
+
+    if tool not in tools:
+        raise ValueError("Unknown tool: " + str(tool))
+    module, function, toolParams = tools[tool]
+
+    names = [param[0] for param in toolParams]
+    unknown = [name for name in params if name not in names]
+    if unknown:
+        raise ValueError("Unknown parameters of tool " + tool + ": " + ", ".join(unknown))
+
+    args = []
+    for name, required, choices, help in toolParams:
+        value = params.get(name, "")
+        if value is None:
+            value = ""
+        value = str(value)
+        if required and value == "":
+            raise ValueError("Missing parameter of tool " + tool + ": " + name)
+        if choices and value != "" and value not in choices:
+            raise ValueError("Invalid value of parameter " + name + ": " + value)
+        if value == "":
+            value = defaults.get(name, "")
+        args.append(value)
+
+    func = getattr(importlib.import_module(module), function)
+    func(*args)
+
+
+def clearMemory():
+
+    ''' Deletes intermediate data of the tools (e.g. memory\\changeFC) from
+        the memory workspaces, so that a worker does not hold them after a job. '''
+
+    import arcpy
+    for workspace in ("memory", "in_memory"):
+        arcpy.Delete_management(workspace)
+
+
+def runJob(line):
+
+    ''' Runs one JSON job spec and returns the result as a JSON line. Errors are
+        reported in the result, so that the worker continues with the next job. '''
+
+    start = time.time()
+    result = {}
+    try:
+        job = json.loads(line)
+        result["tool"] = job.get("tool")
+        if "id" in job:
+            result["id"] = job["id"]
+        runTool(job.get("tool"), job.get("params", {}))
+        result["status"] = "OK"
+    except Exception as e:
+        result["status"] = "ERROR"
+        result["message"] = str(e)
+    finally:
+        # a worker keeps running - free memory workspaces as a separate run does on exit
+        clearMemory()
+    result["seconds"] = round(time.time() - start, 3)
+    return json.dumps(result)
+
+
+def runWorker(port):
+
+    ''' Long-lived worker - keeps arcpy and the tools loaded and runs jobs back
+        to back. Jobs are read from stdin, or from a local socket if port is set.
+        Jobs are run one at a time, as arcpy is not thread-safe. '''
+
+    warmUp()
+
+    if port is None:
+        for line in sys.stdin:
+            if line.strip() == "":
+                continue
+            sys.stdout.write(runJob(line) + "\n")
+            sys.stdout.flush()
+        return
+
+    import socketserver
+
+    class JobHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                line = line.decode("utf-8")
+                if line.strip() == "":
+                    continue
+                self.wfile.write((runJob(line) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+    socketserver.TCPServer.allow_reuse_address = True
+    with socketserver.TCPServer(("127.0.0.1", port), JobHandler) as server:
+        server.serve_forever()
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="ChangeDetection toolbox - headless run of the tools")
+    subparsers = parser.add_subparsers(dest="tool", required=True)
+
+    for tool, (module, function, toolParams) in tools.items():
+        toolParser = subparsers.add_parser(tool, help=function)
+        for name, required, choices, help in toolParams:
+            default = defaults.get(name, "")
+            toolParser.add_argument("--" + name, required=required, choices=choices,
+                                    default=default, help=help)
+
+    workerParser = subparsers.add_parser("worker", help="run jobs from stdin or a local socket")
+    workerParser.add_argument("--port", type=int, default=None,
+                              help="listen on 127.0.0.1:PORT instead of reading stdin")
+
+    args = parser.parse_args(argv)
+
+    if args.tool == "worker":
+        runWorker(args.port)
+    else:
+        params = vars(args)
+        tool = params.pop("tool")
+        runTool(tool, params)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+# ChangeDetection toolbox
+# Columnar change table - attributes of the change layer as memory-mapped NumPy columns
+# Lukas Zubrietovsky, Hana Bobalova
+
+# A change table is a folder with columns code1.npy, code2.npy (indexes into
+# the list of LC categories), area.npy and optionally zone.npy (indexes into
+# the list of zones, empty zone for features with null zone), and
+# categories.json with the lists of categories and zones and names of the
+# source fields.
+
+
+def isChangeTable(path):
+
+    ''' Returns True if path is a folder with a change table. '''
+
+    import os
+    return os.path.isfile(os.path.join(path, "categories.json"))
+
+
+def encodeChanges(changes):
+
+    ''' Dictionary encoding of change codes - returns sorted list of LC
+        categories and arrays of indexes of categories of both periods. Only
+        unique change codes are split. '''
+
+    import numpy as np
+
+    changes, changeIndex = np.unique(np.asarray(changes).astype(str), return_inverse=True)
+    pairs = [change.split("_") for change in changes]
+    categories = sorted({pair[0] for pair in pairs} | {pair[1] for pair in pairs})
+    categoryIndex = {code: i for i, code in enumerate(categories)}
+    changeCode1 = np.array([categoryIndex[pair[0]] for pair in pairs], dtype=np.int32)
+    changeCode2 = np.array([categoryIndex[pair[1]] for pair in pairs], dtype=np.int32)
+    return categories, changeCode1[changeIndex], changeCode2[changeIndex]
+
+
+def writeChangeTable(inFC, fieldChange, fieldArea, outFolder, fieldZone=""):
+
+    ''' Exports change code, area and optionally zone of features of the LC
+        change feature class to a change table. Change codes are stored as
+        indexes to the list of categories (see encodeChanges). '''
+
+    import arcpy, json, os
+    import numpy as np
+
+    fields = [fieldChange, fieldArea]
+    nullValues = {fieldArea: 0}
+    if fieldZone != "":
+        fields.append(fieldZone)
+        # numeric fields need a null value of their type, nulls are read as empty zone
+        zoneType = arcpy.ListFields(inFC, fieldZone)[0].type
+        nulls = {"SmallInteger": -32768, "Integer": -2147483648, "BigInteger": -9223372036854775808,
+                 "Single": np.nan, "Double": np.nan}
+        nullValues[fieldZone] = nulls.get(zoneType, "")
+    array = arcpy.da.TableToNumPyArray(inFC, fields, null_value=nullValues)
+
+    categories, code1, code2 = encodeChanges(array[fieldChange])
+
+    if not os.path.exists(outFolder):
+        os.makedirs(outFolder)
+    # remove columns of a previous export (e.g. zone.npy exported with a zone field)
+    for name in ("code1.npy", "code2.npy", "area.npy", "zone.npy", "categories.json"):
+        if os.path.exists(os.path.join(outFolder, name)):
+            os.remove(os.path.join(outFolder, name))
+    np.save(os.path.join(outFolder, "code1.npy"), code1)
+    np.save(os.path.join(outFolder, "code2.npy"), code2)
+    np.save(os.path.join(outFolder, "area.npy"), array[fieldArea].astype(np.float64))
+
+    zones = []
+    if fieldZone != "":
+        zoneValues = array[fieldZone].astype(str)
+        nullValue = nullValues[fieldZone]
+        if nullValue != "":
+            isNull = np.isnan(array[fieldZone]) if nullValue is np.nan else array[fieldZone] == nullValue
+            zoneValues[isNull] = ""
+        zones, zoneIndex = np.unique(zoneValues, return_inverse=True)
+        zones = zones.tolist()
+        np.save(os.path.join(outFolder, "zone.npy"), zoneIndex.astype(np.int32))
+
+    with open(os.path.join(outFolder, "categories.json"), "w") as f:
+        json.dump({"categories": categories, "zones": zones, "fieldChange": fieldChange,
+                   "fieldArea": fieldArea, "fieldZone": fieldZone}, f)
+
+
+def readChangeTable(inFolder):
+
+    ''' Reads change table - columns are memory-mapped, not copied to memory. '''
+
+    import json, os
+    import numpy as np
+
+    with open(os.path.join(inFolder, "categories.json")) as f:
+        table = json.load(f)
+    for column in ("code1", "code2", "area", "zone"):
+        path = os.path.join(inFolder, column + ".npy")
+        if os.path.exists(path):
+            table[column] = np.load(path, mmap_mode="r")
+    return table
+
+
+def sumPairs(table):
+
+    ''' Frequency and area sums of features by pairs of LC categories of both
+        periods. Returns list of (code1, code2, frequency, area) sorted by
+        change code. '''
+
+    import numpy as np
+
+    categories = table["categories"]
+    k = len(categories)
+    pairIndex = table["code1"].astype(np.int64) * k + table["code2"]
+    frequency = np.bincount(pairIndex, minlength=k * k)
+    sumArea = np.bincount(pairIndex, weights=table["area"], minlength=k * k)
+
+    pairs = []
+    for i in np.flatnonzero(frequency):
+        pairs.append((categories[i // k], categories[i % k], int(frequency[i]), float(sumArea[i])))
+    pairs.sort(key=lambda pair: pair[0] + "_" + pair[1])
+    return pairs
+
+
+def writeStatisticsTable(outTable, fieldCase, fieldArea, totals):
+
+    ''' Creates table with the same fields as output of Statistics_analysis
+        (case field, FREQUENCY, SUM_ area field) from dictionary
+        case value: (frequency, area). '''
+
+    import arcpy
+
+    path, name = outTable.rsplit("\\", 1)
+    arcpy.CreateTable_management(path, name)
+    arcpy.AddField_management(outTable, fieldCase, "TEXT")
+    arcpy.AddField_management(outTable, "FREQUENCY", "LONG")
+    arcpy.AddField_management(outTable, "SUM_" + fieldArea, "DOUBLE")
+    with arcpy.da.InsertCursor(outTable, [fieldCase, "FREQUENCY", "SUM_" + fieldArea]) as cursor:
+        for value in sorted(totals):
+            cursor.insertRow((value, totals[value][0], totals[value][1]))
+
+
+def readChanges(inFC, fieldChange, fieldArea):
+
+    ''' Reads change code and area of features of the LC change feature class
+        to arrays in the same form as readChangeTable, with OIDs of features. '''
+
+    import arcpy
+
+    array = arcpy.da.TableToNumPyArray(inFC, ["OID@", fieldChange, fieldArea], null_value={fieldArea: 0})
+    categories, code1, code2 = encodeChanges(array[fieldChange])
+    return {"categories": categories, "code1": code1, "code2": code2,
+            "area": array[fieldArea], "oid": array["OID@"]}
+
+
+def hierarchyLevel(code1, code2):
+
+    ''' Hierarchy level of change from code1 to code2 - position of the first
+        different character of codes, "0" if codes are equal. If one code is
+        the beginning of the other, level is the position after the shorter. '''
+
+    if code1 == code2:
+        return "0"
+    counter = 1
+    for i in range(min(len(code1), len(code2))):
+        if code1[i] == code2[i]:
+            counter += 1
+        else:
+            break
+    return str(counter)
+
+
+def buildChangeLookup(categories, conversion=None, levels=False):
+
+    ''' Lookup arrays k x k indexed by categories of both periods (code1, code2)
+        with no change flag, hierarchy level if levels is True and, if
+        conversion dictionary (change code: type) is given, type of change
+        ("none" if missing). Features are labelled by indexing, e.g.
+        lookup["type"][code1, code2]. '''
+
+    import numpy as np
+
+    k = len(categories)
+    lookup = {"noChange": np.eye(k, dtype=bool)}
+
+    if levels:
+        lookup["level"] = np.empty((k, k), dtype=object)
+        for i in range(k):
+            for j in range(k):
+                lookup["level"][i, j] = hierarchyLevel(categories[i], categories[j])
+
+    if conversion is not None:
+        lookup["type"] = np.full((k, k), "none", dtype=object)
+        categoryIndex = {code: i for i, code in enumerate(categories)}
+        for change, changeType in conversion.items():
+            pair = change.split("_")
+            if len(pair) == 2 and pair[0] in categoryIndex and pair[1] in categoryIndex:
+                lookup["type"][categoryIndex[pair[0]], categoryIndex[pair[1]]] = changeType
+    return lookup
+
+
+def sumByLookup(table, values, exclude=None):
+
+    ''' Frequency and area sums by values of lookup array (see buildChangeLookup)
+        - features are summed by pairs of categories first, so only k x k
+        values are looked up. Pairs where exclude lookup is True are left out.
+        Returns dictionary value: [frequency, area]. '''
+
+    import numpy as np
+
+    k = len(table["categories"])
+    pairIndex = table["code1"].astype(np.int64) * k + table["code2"]
+    frequency = np.bincount(pairIndex, minlength=k * k)
+    sumArea = np.bincount(pairIndex, weights=table["area"], minlength=k * k)
+
+    totals = {}
+    for i in np.flatnonzero(frequency):
+        code1, code2 = divmod(int(i), k)
+        if exclude is not None and exclude[code1, code2]:
+            continue
+        total = totals.setdefault(str(values[code1, code2]), [0, 0.0])
+        total[0] += int(frequency[i])
+        total[1] += float(sumArea[i])
+    return totals
+
+
+def writeLabels(inFC, field, oids, labels):
+
+    ''' Writes labels of features to a text field of the feature class in one
+        bulk operation (ExtendTable) instead of row by row updates. An existing
+        field is replaced. '''
+
+    import arcpy
+    import numpy as np
+
+    if arcpy.ListFields(inFC, field):
+        arcpy.DeleteField_management(inFC, field)
+
+    # 64-bit join field - large ObjectIDs must not wrap
+    labels = np.asarray(labels).astype(str)
+    array = np.empty(len(oids), dtype=[("JOIN_OID", np.int64), (field, labels.dtype)])
+    array["JOIN_OID"] = oids
+    array[field] = labels
+    arcpy.da.ExtendTable(inFC, arcpy.Describe(inFC).OIDFieldName, array, "JOIN_OID", False)
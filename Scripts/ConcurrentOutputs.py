@@ -0,0 +1,32 @@
+# ChangeDetection toolbox
+# Concurrent writing of independent output files (tables, graphs)
+# Lukas Zubrietovsky, Hana Bobalova
+
+
+def writeOutputs(tasks, maxWorkers=4):
+
+    ''' Writes independent outputs concurrently in a thread pool. Tasks are
+        tuples (output path, function, arguments). An error of one output is
+        reported, but other outputs are still written; an error is raised at
+        the end if any output failed. Tasks must not call arcpy geoprocessing
+        tools, which are not thread-safe. '''
+
+    import arcpy
+    from concurrent.futures import ThreadPoolExecutor
+
+    tasks = [task for task in tasks if task[0] != ""]
+    if not tasks:
+        return
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=min(maxWorkers, len(tasks))) as executor:
+        futures = [(output, executor.submit(function, *args)) for output, function, args in tasks]
+        for output, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                arcpy.AddError("Output " + output + " was not created: " + str(e))
+                failed.append(output)
+
+    if failed:
+        raise RuntimeError("Outputs were not created: " + ", ".join(failed))
@@ -3,24 +3,54 @@
 # Lukas Zubrietovsky, Hana Bobalova
 
 
-def detectChanges(inFC1, fieldCode1, inFC2, fieldCode2,
-                    fieldChange, fieldArea, areaUnit,
-                   noChange, minArea, 
-                   outFC, outConTable, outSumTable):
+def dissolveChanges(inFC, outFC, fields, fieldArea, expression, minArea):
 
-    '''The tool detects land cover (LC) changes by overlay of two vector polygon 
-        feature classes and generates a new feature class of LC changes as well 
-        as contingency table. Unchanged areas and/or areas of minor changes can 
-        be excluded from results. A summary table can be created as needed. '''
+    '''Dissolves adjacent features of the change layer with the same change code.
+        Features with area up to minArea (slivers) are merged into the neighbour
+        with the largest area instead of being dropped, so total area is kept.
+        Dissolve runs in parallel over spatial partitions of the data.
+        Merging of slivers (Eliminate) requires ArcGIS Pro Advanced licence.'''
 
-    # import system moduls
-    import arcpy, os
-    from arcpy import env
+    import arcpy
 
-    # environment settings 
-    folder = outFC.rsplit("\\", 1)
-    env.workspace = folder[0]
-    env.overwriteOutput = True
+    # dissolve in parallel - only adjacent features are merged (single part)
+    with arcpy.EnvManager(parallelProcessingFactor="100%"):
+        arcpy.analysis.PairwiseDissolve(inFC, "memory\\dissolveFC", fields, "", "SINGLE_PART")
+    arcpy.AddField_management("memory\\dissolveFC", fieldArea, "DOUBLE")
+    arcpy.CalculateField_management("memory\\dissolveFC", fieldArea, expression, "PYTHON")
+
+    if minArea == "":
+        arcpy.CopyFeatures_management("memory\\dissolveFC", outFC)
+        return
+
+    # merge slivers into the largest neighbour
+    whereClause = '{} <= {}'.format(arcpy.AddFieldDelimiters("memory\\dissolveFC", fieldArea), minArea)
+    arcpy.MakeFeatureLayer_management("memory\\dissolveFC", "sliverLayer")
+    arcpy.SelectLayerByAttribute_management("sliverLayer", "NEW_SELECTION", whereClause)
+    slivers = int(arcpy.GetCount_management("sliverLayer")[0])
+    if slivers == 0:
+        # Eliminate needs a selection - nothing to merge
+        arcpy.Delete_management("sliverLayer")
+        arcpy.CopyFeatures_management("memory\\dissolveFC", outFC)
+        return
+    arcpy.Eliminate_management("sliverLayer", "memory\\eliminateFC", "AREA")
+    arcpy.Delete_management("sliverLayer")
+
+    # slivers can join two features with the same code - dissolve once more
+    with arcpy.EnvManager(parallelProcessingFactor="100%"):
+        arcpy.analysis.PairwiseDissolve("memory\\eliminateFC", outFC, fields, "", "SINGLE_PART")
+    arcpy.AddField_management(outFC, fieldArea, "DOUBLE")
+    arcpy.CalculateField_management(outFC, fieldArea, expression, "PYTHON")
+
+
+def overlayChanges(inFC1, fieldCode1, inFC2, fieldCode2, fieldChange, fieldArea, areaUnit,
+                   noChange, minArea, outFC, dissolve, fieldZone=""):
+
+    '''Overlay of both LC feature classes - creates feature class of LC changes
+        with change code and area fields, without areas excluded by noChange
+        and minArea. Zone field (if given) is kept in dissolve.'''
+
+    import arcpy
 
     # intersection - new layer of changes is created
     arcpy.Intersect_analysis([inFC1, inFC2], "memory\\changeFC", "ALL", "", "")
@@ -44,36 +74,351 @@ def detectChanges(inFC1, fieldCode1, inFC2, fieldCode2,
     expression = "!SHAPE.AREA@" + areaUnit + "!"
     arcpy.CalculateField_management("memory\\changeFC", fieldArea, expression, "PYTHON")
 
+    # dissolve adjacent features with the same change code
+    changeFC = "memory\\changeFC"
+    if dissolve == "YES":
+        fields = [fieldChange, fieldCode1, fieldCode2]
+        if fieldZone != "":
+            fields.append(fieldZone)
+        dissolveChanges(changeFC, "memory\\dissolvedFC", fields, fieldArea, expression, minArea)
+        changeFC = "memory\\dissolvedFC"
+
     # select regions without change
     if noChange == "NO":
        whereClause = '"' + fieldCode1 + '" <> ' + '"' + fieldCode2 + '"'    
-       arcpy.Select_analysis("memory\\changeFC", "memory\\noChangeFC", whereClause)
+       arcpy.Select_analysis(changeFC, "memory\\noChangeFC", whereClause)
           
     # select minimal area of change
     if minArea != "" and noChange == "YES":
        whereClause = '{} > {}'.format(arcpy.AddFieldDelimiters(outFC, fieldArea), minArea)
-       arcpy.Select_analysis("memory\\changeFC", "memory\\minAreaFC", whereClause)                
+       arcpy.Select_analysis(changeFC, "memory\\minAreaFC", whereClause)                
     if minArea != "" and noChange == "NO":
        whereClause = '{} > {}'.format(arcpy.AddFieldDelimiters("memory\\noChangeFC", fieldArea), minArea)
        arcpy.Select_analysis("memory\\noChangeFC", "memory\\noChangeMinAreaFC", whereClause)
     
     # create final output feature class
     if minArea == "" and noChange == "YES":
-       arcpy.CopyFeatures_management("memory\\changeFC", outFC)
+       arcpy.CopyFeatures_management(changeFC, outFC)
     elif minArea == "" and noChange == "NO": 
        arcpy.CopyFeatures_management("memory\\noChangeFC", outFC)
     elif minArea != "" and noChange == "NO":
        arcpy.CopyFeatures_management("memory\\noChangeMinAreaFC", outFC)
     else:
        arcpy.CopyFeatures_management("memory\\minAreaFC", outFC)
-                                                                             
+
+
+def fingerprintFeatures(inFC):
+
+    '''Fingerprints of features (OID: hash of geometry and attributes), used
+        to find features edited since the previous run.'''
+
+    import arcpy, hashlib
+
+    fields = [f.name for f in arcpy.ListFields(inFC) if f.type not in ("OID", "Geometry")]
+    fields = [f for f in fields if f.lower() not in ("shape_length", "shape_area")]
+    fingerprints = {}
+    with arcpy.da.SearchCursor(inFC, ["OID@", "SHAPE@WKB"] + fields) as cursor:
+        for row in cursor:
+            digest = hashlib.md5(bytes(row[1] or b""))
+            digest.update(repr(row[2:]).encode("utf-8"))
+            fingerprints[str(row[0])] = digest.hexdigest()
+    return fingerprints
+
+
+def fidFieldNames(inFC1, inFC2):
+
+    '''Names of FID fields of both inputs in the output of Intersect - FID_ and
+        name of the input, the second one with suffix _1 if the names are equal.'''
+
+    names = []
+    for inFC in (inFC1, inFC2):
+        name = inFC.replace("/", "\\").rsplit("\\", 1)[-1]
+        if name.lower().endswith(".shp"):
+            name = name[:-4]
+        names.append("FID_" + name)
+    if names[0].lower() == names[1].lower():
+        names[1] = names[1] + "_1"
+    return names
+
+
+def sumChanges(inFC, fieldChange, fieldArea, whereClause=None):
+
+    '''Counts and area sums of features by change code (change: [frequency, area]),
+        in the same order as totals in ChangeTable.'''
+
+    import arcpy
+
+    totals = {}
+    with arcpy.da.SearchCursor(inFC, [fieldChange, fieldArea], whereClause) as cursor:
+        for row in cursor:
+            total = totals.setdefault(str(row[0]), [0, 0.0])
+            total[0] += 1
+            total[1] += row[1]
+    return totals
+
+
+def updateChanges(inFC1, fieldCode1, inFC2, fieldCode2, fieldChange, fieldArea, areaUnit,
+                  noChange, minArea, outFC, state):
+
+    '''Incremental update of the feature class of LC changes - features created
+        from input features edited since the previous run are replaced by a new
+        overlay of the edited features with features of the other period
+        selected by location, so only the area of edits is overlaid. Area sums of changes in state are
+        updated by the removed and added features.'''
+
+    import arcpy
+
+    # edited features - added, deleted or modified since the previous run
+    edited = []
+    for inFC, key in ((inFC1, "fingerprints1"), (inFC2, "fingerprints2")):
+        old = state[key]
+        new = fingerprintFeatures(inFC)
+        edited.append(sorted(oid for oid in set(old) | set(new) if old.get(oid) != new.get(oid)))
+        state[key] = new
+    edited1, edited2 = edited
+    arcpy.AddMessage("Edited features: {} in the first period, {} in the second period".format(
+        len(edited1), len(edited2)))
+    if not edited1 and not edited2:
+        return
+
+    fid1, fid2 = state["fidFields"]
+    whereClause = "{} IN ({}) OR {} IN ({})".format(
+        arcpy.AddFieldDelimiters(outFC, fid1), ",".join(edited1) or "-1",
+        arcpy.AddFieldDelimiters(outFC, fid2), ",".join(edited2) or "-1")
+
+    # subtract features of edited input features
+    totals = state["totals"]
+    for change, (count, area) in sumChanges(outFC, fieldChange, fieldArea, whereClause).items():
+        totals[change][0] -= count
+        totals[change][1] -= area
+    arcpy.MakeFeatureLayer_management(outFC, "removeLayer", whereClause)
+    arcpy.DeleteFeatures_management("removeLayer")
+    arcpy.Delete_management("removeLayer")
+
+    # overlay of edited features of one period with features of the other period in their area
+    pieces = []
+    for n, edited, inFC, otherFC in ((1, edited1, inFC1, inFC2), (2, edited2, inFC2, inFC1)):
+        if not edited:
+            continue
+        editLayer = "editLayer" + str(n)
+        otherLayer = "otherLayer" + str(n)
+        whereClause = "{} IN ({})".format(
+            arcpy.AddFieldDelimiters(inFC, arcpy.Describe(inFC).OIDFieldName), ",".join(edited))
+        arcpy.MakeFeatureLayer_management(inFC, editLayer, whereClause)
+        arcpy.MakeFeatureLayer_management(otherFC, otherLayer)
+        arcpy.SelectLayerByLocation_management(otherLayer, "INTERSECT", editLayer)
+        # empty selection (e.g. only deleted features) would mean the whole layer in Intersect
+        if arcpy.Describe(otherLayer).FIDSet != "":
+            piecesFC = "memory\\editFC" + str(n)
+            inputs = (editLayer, otherLayer) if n == 1 else (otherLayer, editLayer)
+            overlayChanges(inputs[0], fieldCode1, inputs[1], fieldCode2, fieldChange, fieldArea, areaUnit,
+                           noChange, minArea, piecesFC, "NO")
+            pieces.append((piecesFC, inputs))
+        arcpy.Delete_management(editLayer)
+        arcpy.Delete_management(otherLayer)
+
+    for piecesFC, inputs in pieces:
+        # FID fields are named by the inputs (layers or their sources) - rename them as in the output
+        candidates = [fidFieldNames(name1, name2) for name1 in (inputs[0], inFC1) for name2 in (inputs[1], inFC2)]
+        for names in candidates:
+            if all(arcpy.ListFields(piecesFC, name) for name in names):
+                break
+        else:
+            raise RuntimeError("FID fields of input features not found in the overlay of edited features")
+        for name, outName in zip(names, (fid1, fid2)):
+            if name.lower() != outName.lower():
+                arcpy.AlterField_management(piecesFC, name, outName, outName)
+
+    # pairs of two edited features are already in the overlay of the first period
+    if len(pieces) == 2:
+        whereClause = "{} IN ({})".format(arcpy.AddFieldDelimiters("memory\\editFC2", fid1), ",".join(edited1))
+        with arcpy.da.UpdateCursor("memory\\editFC2", fid1, whereClause) as cursor:
+            for row in cursor:
+                cursor.deleteRow()
+
+    # add new features
+    for piecesFC, inputs in pieces:
+        for change, (count, area) in sumChanges(piecesFC, fieldChange, fieldArea).items():
+            total = totals.setdefault(change, [0, 0.0])
+            total[0] += count
+            total[1] += area
+        arcpy.Append_management(piecesFC, outFC, "NO_TEST")
+
+    for change in [change for change in totals if totals[change][0] <= 0]:
+        del totals[change]
+
+def writeContingencyTable(outConTable, listLC1, totals):
+
+    '''Writes contingency table (xls) of area of changes between LC categories
+        of the first (rows) and the second (columns) period.'''
+
+    import xlwt
+
+    dictionary = {}
+    for valChange, (count, valArea) in totals.items():
+        dictionary[valChange] = str(valArea)
+
+    workbook = xlwt.Workbook()
+    sheet = workbook.add_sheet('Sheet_1')
+
+    counter = 1
+    for i in listLC1:
+        sheet.write(0, counter, i)
+        counter += 1
+
+    counter2 = 1
+    for j in range(len(listLC1)):
+        counter = 1
+        for k in range(len(listLC1)):
+            if counter == 1:
+                sheet.write(counter2, 0, listLC1[j])
+            value = str(listLC1[counter2 - 1]) + "_" + str(listLC1[counter - 1])
+            sheet.write(counter2, counter, dictionary.get(value,0))
+            counter += 1
+        counter2 +=1
+
+    workbook.save(outConTable)
+
+
+def writeSummaryTable(outSumTable, fieldChange, fieldArea, totals):
+
+    '''Writes summary table (xls) of frequency and area sum by change code.'''
+
+    import os, re, xlwt
+
+    # sheet named by the table - without characters not allowed by Excel, at most 31 characters
+    name = re.sub(r"[\[\]:\\/?*]", "_", os.path.splitext(os.path.basename(outSumTable))[0])[:31]
+    workbook = xlwt.Workbook()
+    sheet = workbook.add_sheet(name or "Sheet_1")
+
+    sheet.write(0, 0, "OBJECTID")
+    sheet.write(0, 1, fieldChange)
+    sheet.write(0, 2, "FREQUENCY")
+    sheet.write(0, 3, "SUM_" + fieldArea)
+    row = 1
+    for change in sorted(totals):
+        sheet.write(row, 0, row)
+        sheet.write(row, 1, change)
+        sheet.write(row, 2, totals[change][0])
+        sheet.write(row, 3, totals[change][1])
+        row += 1
+
+    workbook.save(outSumTable)
+
+
+def detectChanges(inFC1, fieldCode1, inFC2, fieldCode2,
+                    fieldChange, fieldArea, areaUnit,
+                   noChange, minArea, 
+                   outFC, outConTable, outSumTable, dissolve="NO", validate="NO",
+                   stateFile="", outColumns="", fieldZone="", tolerance=""):
+
+    '''The tool detects land cover (LC) changes by overlay of two vector polygon 
+        feature classes and generates a new feature class of LC changes as well 
+        as contingency table. Unchanged areas and/or areas of minor changes can 
+        be excluded from results. A summary table can be created as needed. 
+        Optionally, adjacent features with the same change code are dissolved
+        and areas of minor changes are merged into their largest neighbour. 
+        Inputs can be validated first (overlaps, gaps, codes, total areas),
+        ignoring overlaps and gaps up to tolerance (area in areaUnit, minArea
+        if not given) or thinner than XY tolerance of the data. 
+        With a state file, a repeated run only re-overlays edited features.
+        The state file is removed while the output is modified and written
+        again only after a successful run, so a failed run ends in a full
+        detection of changes next time. 
+        Attributes of changes can be exported to a columnar change table. '''
+
+    # import system moduls
+    import arcpy, os
+    from arcpy import env
+
+    # environment settings 
+    folder = outFC.rsplit("\\", 1)
+    env.workspace = folder[0]
+    env.overwriteOutput = True
+
+    # merging of minor changes in dissolve needs Advanced licence - check before overlay
+    if dissolve == "YES" and minArea != "" and arcpy.ProductInfo() != "ArcInfo":
+        message = ("Merging of areas of minor changes into neighbours (Eliminate) requires "
+                   "ArcGIS Pro Advanced licence - run without dissolve or without minimal area")
+        arcpy.AddError(message)
+        raise ValueError(message)
+
+    # zone field of the change table - check before overlay
+    if outColumns == "":
+        fieldZone = ""
+    if fieldZone != "" and not (arcpy.ListFields(inFC1, fieldZone) or arcpy.ListFields(inFC2, fieldZone)):
+        message = "Zone field {} not found in input layers".format(fieldZone)
+        arcpy.AddError(message)
+        raise ValueError(message)
+
+    # validation of inputs - stop before overlay if inputs are not valid
+    if validate == "YES":
+        from ValidationOfInputs import validateInputs
+        if tolerance == "":
+            tolerance = minArea if minArea != "" else 0.0
+        report = validateInputs(inFC1, fieldCode1, inFC2, fieldCode2, tolerance, areaUnit=areaUnit)
+        if report:
+            message = "Input layers are not valid:\n" + "\n".join(report)
+            arcpy.AddError(message)
+            raise ValueError(message)
+        arcpy.AddMessage("Input layers are valid")
+
+    # state of the previous run - incremental update if it matches this run
+    import json
+    params = [inFC1, fieldCode1, inFC2, fieldCode2, fieldChange, fieldArea, areaUnit,
+              noChange, minArea, outFC, dissolve]
+    state = None
+    if stateFile != "" and os.path.exists(stateFile) and arcpy.Exists(outFC):
+        with open(stateFile) as f:
+            state = json.load(f)
+        if state.get("params") != params:
+            arcpy.AddMessage("Parameters differ from the previous run - full detection of changes")
+            state = None
+        elif dissolve == "YES":
+            arcpy.AddMessage("Dissolved output can not be updated incrementally - full detection of changes")
+            state = None
+        elif state.get("fidFields") is None:
+            arcpy.AddMessage("Output has no FID fields of inputs - full detection of changes")
+            state = None
+
+    # state is not valid while the output is modified
+    if stateFile != "" and os.path.exists(stateFile):
+        os.remove(stateFile)
+
+    if state is not None:
+        updateChanges(inFC1, fieldCode1, inFC2, fieldCode2, fieldChange, fieldArea, areaUnit,
+                      noChange, minArea, outFC, state)
+    else:
+        overlayChanges(inFC1, fieldCode1, inFC2, fieldCode2, fieldChange, fieldArea, areaUnit,
+                       noChange, minArea, outFC, dissolve, fieldZone)
+        if stateFile != "" or outConTable != "" or outSumTable != "":
+            fidFields = fidFieldNames(inFC1, inFC2)
+            if not all(arcpy.ListFields(outFC, name) for name in fidFields):
+                fidFields = None
+            state = {"params": params,
+                     "fidFields": fidFields,
+                     "totals": sumChanges(outFC, fieldChange, fieldArea)}
+
+        # dissolved output is never updated incrementally - no fingerprints needed
+        if stateFile != "" and dissolve != "YES":
+            state["fingerprints1"] = fingerprintFeatures(inFC1)
+            state["fingerprints2"] = fingerprintFeatures(inFC2)
+
+    if stateFile != "":
+        with open(stateFile + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(stateFile + ".tmp", stateFile)
+
+    # change table (code1, code2, area, zone) for repeated statistics by tools 2-4
+    if outColumns != "":
+        from ChangeTable import writeChangeTable
+        writeChangeTable(outFC, fieldChange, fieldArea, outColumns, fieldZone)
+
 
     ## ------------------------ CREATE CONTINGENCY TABLE --------------------
     # calculate values of contingency table
+    listLC1 = []
     if outConTable != "":
-        # summary statistics 
-        arcpy.Statistics_analysis(outFC, "memory\\tableChange", [[fieldArea, "SUM"]], fieldChange)
-                
         with arcpy.da.SearchCursor(outFC,fieldCode1) as cursor:
                 listLC1 = sorted({row[0] for row in cursor})
         with arcpy.da.SearchCursor(inFC2,fieldCode2) as cursor:
@@ -86,51 +431,16 @@ def detectChanges(inFC1, fieldCode1, inFC2, fieldCode2,
 
         listLC1.sort() # sorted list of unique land cover categories of both periods
 
-        sumArea = "SUM_" + fieldArea
-        dictionary = {}
-        with arcpy.da.SearchCursor("memory\\tableChange", [fieldChange, sumArea]) as cursor:
-            for row in cursor:
-                valChange = str(row[0]) 
-                valArea = str(row[1]) 
-                dictionary[valChange] = valArea
- 
-
-        # create contingency statistical table
-        import xlwt
-
-        workbook = xlwt.Workbook()
-        sheet = workbook.add_sheet('Sheet_1')
-
-        counter = 1
-        for i in listLC1:
-            sheet.write(0, counter, i)
-            counter += 1
-
-        counter2 = 1
-        for j in range(len(listLC1)):
-            counter = 1
-            for k in range(len(listLC1)):
-                if counter == 1:
-                    sheet.write(counter2, 0, listLC1[j])
-                value = str(listLC1[counter2 - 1]) + "_" + str(listLC1[counter - 1])
-                sheet.write(counter2, counter, dictionary.get(value,0))
-                counter += 1
-            counter2 +=1
-
-        workbook.save(outConTable)
-        
-        # create summary table                              
-    if outSumTable != "": 
-        
-        tablePath = outSumTable.rsplit("\\", 1)  
-        tableNameExt = tablePath[1].rsplit(".",1)
-        tableName = tableNameExt[0]
-
-        arcpy.analysis.Statistics(outFC, "memory\\tableName", [[fieldArea, "SUM"]], fieldChange)
- 
-        arcpy.TableToExcel_conversion("memory\\tableName", outSumTable)
+    # contingency and summary table are written concurrently from area sums of changes
+    # (kept up to date in incremental runs)
+    if outConTable != "" or outSumTable != "":
+        from ConcurrentOutputs import writeOutputs
+        writeOutputs([(outConTable, writeContingencyTable, (outConTable, listLC1, state["totals"])),
+                      (outSumTable, writeSummaryTable, (outSumTable, fieldChange, fieldArea, state["totals"]))])
 
 if __name__ == '__main__':
+    import arcpy
+
     inFC1 = arcpy.GetParameterAsText(0)           # input LC feature class from the first period
     fieldCode1 = arcpy.GetParameterAsText(1)      # input field with LC codes from the first period
     inFC2 = arcpy.GetParameterAsText(2)           # input LC feature class from the second period
@@ -143,6 +453,8 @@ if __name__ == '__main__':
     outFC = arcpy.GetParameterAsText(9)           # output LC change feature class
     outConTable = arcpy.GetParameterAsText(10)    # output contingency table (xls)
     outSumTable = arcpy.GetParameterAsText(11)    # output summary table (xls)
+    # parameters dissolve, validate, tolerance, stateFile, outColumns and fieldZone
+    # are not in the toolbox - available from Python or ChangeDetectionCLI.py only
   
     detectChanges(inFC1, fieldCode1, inFC2, fieldCode2,
                     fieldChange, fieldArea, areaUnit,
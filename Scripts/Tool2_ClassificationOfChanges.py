@@ -10,7 +10,9 @@ def classifyChanges(inFC, fieldChange, fieldArea, areaUnit, fieldType,
         conversion table.This tool does not create a new change layer, it only 
         updates an existing change layer by adding a changetype attribute. It also
         creates a summary table of absolute and relative proportions of each type 
-        of change in the total area and graphs based on these values.'''
+        of change in the total area and graphs based on these values. If input
+        is change table exported by Tool 1, only the summary table and graphs
+        are created.'''
 
     # import system
     import arcpy, os
@@ -22,9 +24,9 @@ def classifyChanges(inFC, fieldChange, fieldArea, areaUnit, fieldType,
     env.overwriteOutput = True
     env.addOutputsToMap = False
 
-    # add field for type of change
-    arcpy.AddField_management(inFC, fieldType, "TEXT")
-
+    from ChangeTable import (isChangeTable, readChangeTable, readChanges, buildChangeLookup,
+                             sumByLookup, writeLabels, writeStatisticsTable)
+    changeTable = isChangeTable(inFC)
 
     # conversion table - from excel to arcgis table
     #inExcel = inConTable.rsplit("\\", 1)
@@ -43,13 +45,16 @@ def classifyChanges(inFC, fieldChange, fieldArea, areaUnit, fieldType,
             dictionary[changeValue] = typeValue
 
 
-    # update layer attribute table with change types from conversion table
+    # lookup array of change types for pairs of LC categories
+    if changeTable:
+        table = readChangeTable(inFC)
+    else:
+        table = readChanges(inFC, fieldChange, fieldArea)
+    lookup = buildChangeLookup(table["categories"], dictionary)
 
-    with arcpy.da.UpdateCursor(inFC , (fieldChange,fieldType)) as cursor:
-        for row in cursor:
-            val = dictionary.get(row[0], "none")
-            row[1] = val
-            cursor.updateRow(row)
+    # update layer attribute table with change types from conversion table
+    if not changeTable:
+        writeLabels(inFC, fieldType, table["oid"], lookup["type"][table["code1"], table["code2"]])
 
     # add layer to TOC
 #     mxd = arcpy.mapping.MapDocument("CURRENT")
@@ -62,20 +67,12 @@ def classifyChanges(inFC, fieldChange, fieldArea, areaUnit, fieldType,
 
     # create summary table
 
+    # frequency and area sums by type of change
+    exclude = None
     if noChange == "NO":
-        arcpy.Select_analysis(inFC,"memory\\selectFC")
-        with arcpy.da.UpdateCursor("memory\\selectFC", fieldChange) as cursor:
-            for row in cursor:
-                change = row[0]
-                changeSplit = change.split("_")
-                code1 = changeSplit[0]
-                code2 = changeSplit[1]
-                if code1 == code2:
-                    cursor.deleteRow()
-         
-        arcpy.Statistics_analysis("memory\\selectFC", "memory\\sumTable", [[fieldArea, "SUM"]], fieldType)
-    else:
-        arcpy.Statistics_analysis(inFC, "memory\\sumTable", [[fieldArea, "SUM"]], fieldType)
+        exclude = lookup["noChange"]
+    totals = sumByLookup(table, lookup["type"], exclude)
+    writeStatisticsTable("memory\\sumTable", fieldType, fieldArea, totals)
 
     ## calculate proportions of area and frequency
     # 1. add proportion fields
@@ -175,6 +172,8 @@ def classifyChanges(inFC, fieldChange, fieldArea, areaUnit, fieldType,
             plt.close(fig)
 
 if __name__ == '__main__':
+    import arcpy
+
     inFC = arcpy.GetParameterAsText(0)            # input feature class of LC changes 
     fieldChange = arcpy.GetParameterAsText(1)     # field with change codes
     fieldArea = arcpy.GetParameterAsText(2)       # area field
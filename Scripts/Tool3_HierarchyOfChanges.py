@@ -10,7 +10,8 @@ def detectHierarchy(inFC, fieldChange, fieldArea, areaUnit,
     '''Tool determines the hierarchy level of land cover (LC) change (if applicable). 
        A new field with hierarchy level is added to the attribute table of LC change 
        feature class. Summary table is calculated and graphs of area proportions of 
-       hierarchy levels are optionally created.  '''
+       hierarchy levels are optionally created. If input is change table exported
+       by Tool 1, only the summary table and graphs are created.  '''
 
     # import system moduls
     import arcpy, os
@@ -21,46 +22,36 @@ def detectHierarchy(inFC, fieldChange, fieldArea, areaUnit,
     env.workspace = folder[0]
     env.overwriteOutput = True
 
-    # add field 
-    arcpy.AddField_management(inFC, fieldHL, "TEXT")
+    from ChangeTable import (isChangeTable, readChangeTable, readChanges, buildChangeLookup,
+                             sumByLookup, writeLabels, writeStatisticsTable)
+    changeTable = isChangeTable(inFC)
+
+    # lookup array of hierarchy levels for pairs of LC categories
+    if changeTable:
+        table = readChangeTable(inFC)
+    else:
+        table = readChanges(inFC, fieldChange, fieldArea)
+    lookup = buildChangeLookup(table["categories"], levels=True)
 
     # calculate values of hierarchy of change and insert to table
-    cursor = arcpy.UpdateCursor(inFC, [fieldChange, fieldHL])
-    for row in cursor:
-        change = row.getValue(fieldChange)
-        changeSplit = change.split("_")
-        code1 = changeSplit[0]
-        code2 = changeSplit[1]
-        if code1 == code2:
-            row.setValue(fieldHL, 0)
-        else:
-            counter = 1
-            for i in range(len(code1)):
-                if code1[i] == code2[i]:
-                    counter += 1
-                else:
-                    break
-            hierLevel = str(counter)
-            row.setValue(fieldHL, hierLevel)
-        cursor.updateRow(row)
-    del cursor
-    del row
+    if not changeTable:
+        writeLabels(inFC, fieldHL, table["oid"], lookup["level"][table["code1"], table["code2"]])
 
     # add layer to TOC
-    mxd = arcpy.mapping.MapDocument("CURRENT")
-    df = mxd.activeDataFrame
-    addLayer = arcpy.mapping.Layer(inFC)
-    arcpy.mapping.AddLayer(df, addLayer, "AUTO_ARRANGE")
-    del mxd, addLayer
+#     mxd = arcpy.mapping.MapDocument("CURRENT")
+#     df = mxd.activeDataFrame
+#     addLayer = arcpy.mapping.Layer(inFC)
+#     arcpy.mapping.AddLayer(df, addLayer, "AUTO_ARRANGE")
+#     del mxd, addLayer
 
     ## -------------------------------- CREATE TABLE -----------------------------
 
+    # frequency and area sums by hierarchy level
+    exclude = None
     if noChange == "NO":
-        whereClause = "{} <> '0'".format(arcpy.AddFieldDelimiters(inFC, fieldHL))
-        arcpy.Select_analysis(inFC,"in_memory\\selectFC",whereClause)
-        arcpy.Statistics_analysis("in_memory\\selectFC", "in_memory\\sumTable", [[fieldArea, "SUM"]], fieldHL)
-    else:
-        arcpy.Statistics_analysis(inFC, "in_memory\\sumTable", [[fieldArea, "SUM"]], fieldHL)
+        exclude = lookup["noChange"]
+    totals = sumByLookup(table, lookup["level"], exclude)
+    writeStatisticsTable("in_memory\\sumTable", fieldHL, fieldArea, totals)
 
     ## calculate proportions of area and frequency
     # 1. add proportion fields
@@ -153,6 +144,8 @@ def detectHierarchy(inFC, fieldChange, fieldArea, areaUnit,
             plt.close(fig)
 
 if __name__ == '__main__':
+    import arcpy
+
     inFC = arcpy.GetParameterAsText(0)              # input feature class of LC changes
     fieldChange = arcpy.GetParameterAsText(1)       # field with change codes
     fieldArea = arcpy.GetParameterAsText(2)         # area field
@@ -3,13 +3,111 @@
 # Lukas Zubrietovsky, Hana Bobalova
 
 
+def writeStatTable(outStatTable, codeLC, listLCs, dictLC1, dictLC2, listNet,
+                   listGain, listLoss, listUnCons, listUnConAreas, intervals=None):
+
+    ''' Writes statistical table (xls) with net change, gains and losses and
+    contributors to net change of the selected category. Confidence intervals
+    of net change, gains and losses are added if given, with values corrected
+    for misclassification if intervals include them. '''
+
+    import xlwt
+
+    # create woorkbook with three sheets
+    workbook = xlwt.Workbook()
+    sheet1 = workbook.add_sheet("Net change")
+    sheet2 = workbook.add_sheet("Gains and Losses")
+    if codeLC != "":
+        sheet3 = workbook.add_sheet("Contributors")
+
+    # first table - categories of the first and second period, net change             
+    sheet1.write(0,0, "All categories")                                                 
+    sheet1.write(0,1, "Area in first period")
+    sheet1.write(0,2, "Area in second period")
+    sheet1.write(0,3, "Net change")
+    for i in range(len(listLCs)):
+        sheet1.write(i+1,0, listLCs[i])
+        sheet1.write(i+1,1, dictLC1.get(listLCs[i]))
+        sheet1.write(i+1,2, dictLC2.get(listLCs[i]))
+        sheet1.write(i+1,3, listNet[i])
+
+    # second table - gains and losses by category
+    sheet2.write(0,0, "Category")
+    sheet2.write(0,1, "Gain")
+    sheet2.write(0,2, "Loss")
+    for i in range(len(listLCs)):
+        sheet2.write(i+1, 0, listLCs[i])
+        sheet2.write(i+1, 1, listGain[i])
+        sheet2.write(i+1, 2, listLoss[i])
+    
+    # confidence intervals - lower and upper limits
+    if intervals is not None:
+        limits = [" - lower " + intervals["confidence"] + " % limit", " - upper " + intervals["confidence"] + " % limit"]
+        corrected = intervals.get("corrected")
+        columns = [(sheet1, 4, "Net change", "net"), (sheet2, 3, "Gain", "gain"),
+                   (sheet2, 5 if corrected is None else 6, "Loss", "loss")]
+        for sheet, column, title, name in columns:
+            # point estimate corrected for misclassification - mapped values differ
+            if corrected is not None:
+                sheet.write(0, column, title + " - corrected for misclassification")
+                for i in range(len(listLCs)):
+                    sheet.write(i+1, column, corrected[name][i])
+                column += 1
+            for j in range(2):
+                sheet.write(0, column + j, title + limits[j])
+                for i in range(len(listLCs)):
+                    sheet.write(i+1, column + j, intervals[name][j][i])
+
+    # third table - contributos to net change of category
+    if codeLC != "":
+        sheet3.write(0,0, "Category " + codeLC)
+        sheet3.write(0,1, "Area of change")
+        for i in range(len(listUnCons)):
+            sheet3.write(i+1, 0, listUnCons[i])
+            sheet3.write(i+1, 1, listUnConAreas[i])
+        
+    workbook.save(outStatTable)
+
+
+def drawGraph(outGraph, listCategories, listValues, color, unit, title,
+              listValues2=None, color2=None):
+
+    ''' Draws horizontal bar graph of area by category. Each graph is a separate
+    figure (not pyplot state), so that graphs can be drawn concurrently. '''
+
+    import numpy as np
+    from matplotlib.figure import Figure
+
+    # graph writes from the bottom
+    listCategories = list(reversed(listCategories))
+
+    space = 1
+    quantity = len(listCategories) + space
+    y_pos = np.arange(space, quantity)
+
+    fig = Figure()
+    ax = fig.subplots()
+    ax.grid(True)
+    ax.barh(y_pos, list(reversed(listValues)), align='center', color = color)
+    if listValues2 is not None:
+        ax.barh(y_pos, list(reversed(listValues2)), align='center', color = color2)
+    ax.set_yticks(y_pos)
+    ax.set_yticklabels(listCategories)
+    ax.set_xlabel('Area ' + '(' +  unit + ')')
+    ax.set_title(title)
+    fig.savefig(outGraph)
+
+
 def computeStatistics(inFC, fieldChange, fieldArea, areaUnit, 
-                    codeLC, outStatTable, outGraphNet, outGraphGL, outGraphCon):
+                    codeLC, outStatTable, outGraphNet, outGraphGL, outGraphCon,
+                    replicates="", confidence="", inMisclassTable=""):
 
     ''' The tool creates three types of statistical tables. First - net change by 
     land cover (LC) category, second - gains and losses by LC category, third - 
     contributors to net change by selected LC category. Optionally, graphs based 
-    on these values can be created. '''
+    on these values can be created. Input can be feature class of LC changes
+    or change table exported by Tool 1. Optionally, bootstrap confidence 
+    intervals of net change, gains and losses are added to the tables. '''
     
     # system moduls
     import arcpy, os
@@ -23,9 +121,6 @@ def computeStatistics(inFC, fieldChange, fieldArea, areaUnit,
     # input values
     fieldSumArea = "SUM_" + fieldArea
 
-    # create statistics table
-    arcpy.Statistics_analysis(inFC, "memory\\statTable", [[fieldArea, "SUM"]], fieldChange)
-
     ## -----------  create lists and dictionaries for calculations -----------
     
     # values from table to lists and dictionaries
@@ -33,16 +128,28 @@ def computeStatistics(inFC, fieldChange, fieldArea, areaUnit,
     listCode2 = []      # list of LC codes from the second period
     listSumArea = []    # list of area sums for change combinations 
 
-    with arcpy.da.SearchCursor("memory\\statTable", [fieldChange, fieldSumArea]) as cursor:
-        for row in cursor:
-            change = row[0]
-            sumArea = row[1] 
-            changeSplit = change.split("_")
-            code1 = changeSplit[0] 
-            code2 = changeSplit[1]
+    from ChangeTable import isChangeTable, readChangeTable, sumPairs
+    if isChangeTable(inFC):
+        # input is change table exported by Tool 1 - area sums directly from columns
+        changeTable = readChangeTable(inFC)
+        for code1, code2, frequency, sumArea in sumPairs(changeTable):
             listCode1.append(code1)
             listCode2.append(code2)
             listSumArea.append(sumArea)
+    else:
+        # create statistics table
+        arcpy.Statistics_analysis(inFC, "memory\\statTable", [[fieldArea, "SUM"]], fieldChange)
+
+        with arcpy.da.SearchCursor("memory\\statTable", [fieldChange, fieldSumArea]) as cursor:
+            for row in cursor:
+                change = row[0]
+                sumArea = row[1] 
+                changeSplit = change.split("_")
+                code1 = changeSplit[0] 
+                code2 = changeSplit[1]
+                listCode1.append(code1)
+                listCode2.append(code2)
+                listSumArea.append(sumArea)
    
     listLC1 = []          # list of unique values of LC codes from the first period 
     listLC2 = []          # list of unique values of LC codes from the second period
@@ -135,6 +242,9 @@ def computeStatistics(inFC, fieldChange, fieldArea, areaUnit,
 
     ## -------------------- calculate third table and graph  - contributors to net change -------------------
 
+    listUnCons = []         # sorted list of contributors
+    listUnConAreas = []     # sorted list of area of contributions
+
     if codeLC != "":
         listCon = []        # list of contributors (LC codes)
         listConArea = []    # list of area of contributions
@@ -179,127 +289,77 @@ def computeStatistics(inFC, fieldChange, fieldArea, areaUnit,
         for code in listUnCons:
             listUnConAreas.append(dictCon.get(code)) 
                    
-
-    ## ---------------------------create xls table --------------------------------
-    import xlwt
-
-    # create woorkbook with three sheets
-    workbook = xlwt.Workbook()
-    sheet1 = workbook.add_sheet("Net change")
-    sheet2 = workbook.add_sheet("Gains and Losses")
-    if codeLC != "":
-        sheet3 = workbook.add_sheet("Contributors")
-
-    # first table - categories of the first and second period, net change             
-    sheet1.write(0,0, "All categories")                                                 
-    sheet1.write(0,1, "Area in first period")
-    sheet1.write(0,2, "Area in second period")
-    sheet1.write(0,3, "Net change")
-    for i in range(len(listLCs)):
-        sheet1.write(i+1,0, listLCs[i])
-        sheet1.write(i+1,1, dictLC1.get(listLCs[i]))
-        sheet1.write(i+1,2, dictLC2.get(listLCs[i]))
-        sheet1.write(i+1,3, listNet[i])
-
-    # second table - gains and losses by category
-    sheet2.write(0,0, "Category")
-    sheet2.write(0,1, "Gain")
-    sheet2.write(0,2, "Loss")
-    for i in range(len(listLCs)):
-        sheet2.write(i+1, 0, listLCs[i])
-        sheet2.write(i+1, 1, listGain[i])
-        sheet2.write(i+1, 2, listLoss[i])
-        
-    # third table - contributos to net change of category
-    if codeLC != "":
-        sheet3.write(0,0, "Category " + codeLC)
-        sheet3.write(0,1, "Area of change")
-        for i in range(len(listUnCons)):
-            sheet3.write(i+1, 0, listUnCons[i])
-            sheet3.write(i+1, 1, listUnConAreas[i])
-            
-    workbook.save(outStatTable)
-
-    ## ---------------------------- create graphs --------------------------------
+    ## -------------------- confidence intervals - bootstrap of features -------------------
+
+    intervals = None
+    if replicates != "":
+        from ChangeTable import readChanges
+        from UncertaintyOfChanges import bootstrapChanges, correctedChanges, readMisclassTable
+
+        if confidence == "":
+            confidence = "95"
+        if int(replicates) < 1 or not 0 < float(confidence) < 100:
+            message = ("Number of bootstrap replicates must be at least 1 and confidence level "
+                       "between 0 and 100 percent")
+            arcpy.AddError(message)
+            raise ValueError(message)
+
+        if not isChangeTable(inFC):
+            changeTable = readChanges(inFC, fieldChange, fieldArea)
+        categories = changeTable["categories"]
+        code1, code2, area = changeTable["code1"], changeTable["code2"], changeTable["area"]
+
+        misclass = None
+        if inMisclassTable != "":
+            misclass = readMisclassTable(inMisclassTable, categories)
+
+        result = bootstrapChanges(code1, code2, area, len(categories), int(replicates),
+                                  float(confidence), misclass)
+
+        # limits in order of listLCs
+        index = [categories.index(code) for code in listLCs]
+        intervals = {"confidence": confidence}
+        for name, (lower, upper) in result.items():
+            intervals[name] = ([float(lower[i]) for i in index], [float(upper[i]) for i in index])
+
+        # intervals with misclassification are centred on corrected values, not on mapped values
+        if misclass is not None:
+            corrected = correctedChanges(code1, code2, area, len(categories), misclass)
+            intervals["corrected"] = {name: [float(values[i]) for i in index]
+                                      for name, values in corrected.items()}
+
+    ## ------------------- create xls table and graphs concurrently --------------------
     if outGraphNet != "" or outGraphGL != "" or outGraphCon != "":
         
-        import matplotlib.pyplot as plt
-        plt.rcdefaults()
-        import numpy as np
-        import matplotlib.pyplot as plt
-        
-        listLCs.reverse() # graph writes from the bottom
+        import matplotlib
+        matplotlib.rcdefaults()
+        matplotlib.rcParams.update({'axes.labelsize':'large'})
+        matplotlib.rcParams.update({'xtick.labelsize':'large'})
+        matplotlib.rcParams.update({'ytick.labelsize':'large'})
+
+    dictUnits = {"Ares":"a", "Hectares":"ha", "Square meters":"m2", "Square kilometers":"km2"}
+    unit = dictUnits[areaUnit]
+
+    from ConcurrentOutputs import writeOutputs
+    writeOutputs([
+        # statistical table
+        (outStatTable, writeStatTable, (outStatTable, codeLC, listLCs, dictLC1, dictLC2, listNet,
+                                        listGain, listLoss, listUnCons, listUnConAreas, intervals)),
+        # first graph - net change by category
+        (outGraphNet, drawGraph, (outGraphNet, listLCs, listNet, "blue", unit,
+                                  'Net change of area by category')),
+        # second graph - gains and losses
+        (outGraphGL, drawGraph, (outGraphGL, listLCs, listGain, "red", unit,
+                                 'Gains and losses of area by category', listLoss, "blue")),
+        # third graph - contributors to net change of category
+        (outGraphCon, drawGraph, (outGraphCon, listUnCons, listUnConAreas, "blue", unit,
+                                  'Contributors to net change of category ' + codeLC)),
+        ])
 
-        dictUnits = {"Ares":"a", "Hectares":"ha", "Square meters":"m2", "Square kilometers":"km2"}
-        unit = dictUnits[areaUnit]
-        
-    # create first graph - net change by category
-    if outGraphNet != "":
-
-        listNet.reverse()
-
-        plt.rcParams.update({'axes.labelsize':'large'})
-        plt.rcParams.update({'xtick.labelsize':'large'})
-        plt.rcParams.update({'ytick.labelsize':'large'})
-
-        space1 = 1
-        quantity1 =  len(listLCs) + space1
-        y_pos1 = np.arange(space1, quantity1)
-
-        plt.grid(True)
-        plt.barh(y_pos1, listNet, align='center', color = "blue")
-        plt.yticks(y_pos1, listLCs)
-        plt.xlabel('Area ' + '(' +  unit + ')')
-        plt.title('Net change of area by category')
-        plt.savefig(outGraphNet)
-        plt.close()
-
-    # create second graph - gains and losses
-    if outGraphGL != "":
-
-        listGain.reverse()
-        listLoss.reverse()
-
-        plt.rcParams.update({'axes.labelsize':'large'})
-        plt.rcParams.update({'xtick.labelsize':'large'})
-        plt.rcParams.update({'ytick.labelsize':'large'})
-
-        space2 = 1
-        quantity2 =  len(listLCs) + space2
-        y_pos2 = np.arange(space2, quantity2)
-
-        plt.grid(True)
-        plt.barh(y_pos2, listGain, align='center', color = "red")
-        plt.barh(y_pos2, listLoss, align='center', color = "blue")
-        plt.yticks(y_pos2, listLCs)
-        plt.xlabel('Area ' + '(' +  unit + ')')
-        plt.title('Gains and losses of area by category')
-        plt.savefig(outGraphGL)
-        plt.close()
-
-    # create third graph - contributors to net change of category
-    if outGraphCon != "":
-        
-        listUnCons.reverse()
-        listUnConAreas.reverse()
-
-        plt.rcParams.update({'axes.labelsize':'large'})
-        plt.rcParams.update({'xtick.labelsize':'large'})
-        plt.rcParams.update({'ytick.labelsize':'large'})
-
-        space3 = 1
-        quantity3 = len(listUnCons) + space3
-        y_pos3 = np.arange(space3, quantity3)
-
-        plt.grid(True)
-        plt.barh(y_pos3, listUnConAreas, align='center', color = "blue")
-        plt.yticks(y_pos3, listUnCons)
-        plt.xlabel('Area ' + '(' +  unit + ')') 
-        plt.title('Contributors to net change of category ' + codeLC)
-        plt.savefig(outGraphCon)
-        plt.close()
 
 if __name__ == '__main__':
+    import arcpy
+
     inFC = arcpy.GetParameterAsText(0)              # input feature class of LC changes
     fieldChange = arcpy.GetParameterAsText(1)       # field with change codes
     fieldArea = arcpy.GetParameterAsText(2)         # area field
@@ -309,6 +369,8 @@ if __name__ == '__main__':
     outGraphNet = arcpy.GetParameterAsText(6)       # output graph of net change
     outGraphGL = arcpy.GetParameterAsText(7)        # output graph of gains and losses
     outGraphCon = arcpy.GetParameterAsText(8)       # output graph of contributors to net change
+    # parameters replicates, confidence and inMisclassTable are not in the toolbox
+    # - available from Python or ChangeDetectionCLI.py only
     
     computeStatistics(inFC, fieldChange, fieldArea, areaUnit, 
                     codeLC, outStatTable, outGraphNet, outGraphGL, outGraphCon)
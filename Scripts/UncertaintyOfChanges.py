@@ -0,0 +1,181 @@
+# ChangeDetection toolbox
+# Uncertainty of land cover changes - bootstrap confidence intervals
+# Lukas Zubrietovsky, Hana Bobalova
+
+
+def sampleCategories(codes, cumulative, random):
+
+    ''' Samples true categories of features for mapped categories (codes) from
+        rows of cumulative misclassification matrix and uniform random numbers
+        (replicates, features). Rows are shifted by their index, so that all
+        rows are searched at once in one sorted array. '''
+
+    import numpy as np
+
+    k = cumulative.shape[0]
+    flat = (cumulative + np.arange(k)[:, None]).ravel()
+    codes = np.asarray(codes).astype(np.int64)
+    sample = np.searchsorted(flat, random + codes, side="right") - codes * k
+    return np.minimum(sample, k - 1)
+
+
+def transitionReplicates(code1, code2, area, k, replicates, seed, misclass=None):
+
+    ''' Computes bootstrap replicates of the transition matrix (area of change
+        from category i to category j) in one NumPy batch. Features are
+        resampled by Poisson bootstrap (each feature is taken Poisson(1) times),
+        which is vectorised and for large numbers of features equal to
+        resampling with replacement. With misclassification matrix (probability
+        of true category j for mapped category i), true categories of both
+        periods are sampled for each feature in each replicate, so intervals
+        include uncertainty of classification. Returns array (replicates, k, k). '''
+
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    weights = rng.poisson(1.0, size=(replicates, len(area))) * area
+    if misclass is None:
+        pairIndex = np.broadcast_to(np.asarray(code1).astype(np.int64) * k + code2, weights.shape)
+    else:
+        cumulative = np.cumsum(misclass, axis=1)
+        cumulative[:, -1] = 1.0
+        true1 = sampleCategories(code1, cumulative, rng.random(weights.shape))
+        true2 = sampleCategories(code2, cumulative, rng.random(weights.shape))
+        pairIndex = true1 * k + true2
+    offsets = (np.arange(replicates, dtype=np.int64) * k * k)[:, None]
+    matrices = np.bincount((pairIndex + offsets).ravel(), weights=weights.ravel(),
+                           minlength=replicates * k * k).reshape(replicates, k, k)
+    return matrices
+
+
+def changesOfMatrices(matrices):
+
+    ''' Net change, gains and losses of categories from transition matrices
+        (..., k, k). Losses are negative as in Tool 4. '''
+
+    import numpy as np
+
+    area1 = matrices.sum(axis=-1)                       # area in first period
+    area2 = matrices.sum(axis=-2)                       # area in second period
+    unchanged = np.diagonal(matrices, axis1=-2, axis2=-1)
+    return area2 - area1, area2 - unchanged, unchanged - area1
+
+
+def changeReplicates(code1, code2, area, k, batches, seeds, misclass=None):
+
+    ''' Net change, gains and losses of categories for bootstrap replicates
+        computed in batches (sizes and seeds), each array (replicates, k). '''
+
+    import numpy as np
+
+    results = [changesOfMatrices(transitionReplicates(code1, code2, area, k, size, seed, misclass))
+               for size, seed in zip(batches, seeds)]
+    return tuple(np.concatenate([result[i] for result in results]) for i in range(3))
+
+
+def correctedChanges(code1, code2, area, k, misclass):
+
+    ''' Net change, gains and losses of categories corrected for
+        misclassification - expected transition matrix P.T @ T @ P, where T is
+        the mapped transition matrix and P misclassification matrix. Returns
+        dictionary {"net"|"gain"|"loss": array of length k}. '''
+
+    import numpy as np
+
+    pairIndex = np.asarray(code1).astype(np.int64) * k + code2
+    matrix = np.bincount(pairIndex, weights=area, minlength=k * k).reshape(k, k)
+    matrix = misclass.T @ matrix @ misclass
+    return dict(zip(("net", "gain", "loss"), changesOfMatrices(matrix)))
+
+
+def bootstrapChanges(code1, code2, area, k, replicates, confidence=95.0,
+                     misclass=None, batchSize=100, processes=None, seed=0):
+
+    ''' Bootstrap confidence intervals of net change, gains and losses of LC
+        categories from per-feature arrays (code1, code2 - indexes of
+        categories, area). Replicates are computed in batches, in a process
+        pool with one task (list of batches) per worker. Returns dictionary
+        {"net"|"gain"|"loss": (lower, upper)} with arrays of length k. '''
+
+    import os, sys
+    import numpy as np
+    from concurrent.futures import ProcessPoolExecutor
+
+    if replicates < 1:
+        raise ValueError("Number of bootstrap replicates must be at least 1")
+    if not 0 < confidence < 100:
+        raise ValueError("Confidence level must be between 0 and 100 percent")
+
+    code1 = np.asarray(code1).astype(np.int32)
+    code2 = np.asarray(code2).astype(np.int32)
+    area = np.asarray(area, dtype=np.float64)
+
+    # keep one batch of weights in about 80 MB of memory (sampling of true
+    # categories needs a few more arrays of the same size)
+    maxElements = 10000000 if misclass is None else 2500000
+    batchSize = max(1, min(batchSize, maxElements // max(1, len(area)), replicates))
+    batches = [min(batchSize, replicates - start) for start in range(0, replicates, batchSize)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batches))
+
+    # ArcGIS Pro runs scripts in its own executable - pool needs python.exe
+    if os.name == "nt" and not sys.executable.lower().endswith("python.exe"):
+        import multiprocessing
+        multiprocessing.set_executable(os.path.join(sys.exec_prefix, "python.exe"))
+
+    workers = min(processes or os.cpu_count() or 1, len(batches))
+    if workers == 1:
+        results = [changeReplicates(code1, code2, area, k, batches, seeds, misclass)]
+    else:
+        # arrays are sent to each worker once, batches are split between workers
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(changeReplicates, code1, code2, area, k,
+                                       batches[i::workers], seeds[i::workers], misclass)
+                       for i in range(workers)]
+            results = [future.result() for future in futures]
+
+    alpha = (100.0 - float(confidence)) / 2
+    intervals = {}
+    for i, name in enumerate(("net", "gain", "loss")):
+        values = np.concatenate([result[i] for result in results])
+        intervals[name] = (np.percentile(values, alpha, axis=0), np.percentile(values, 100 - alpha, axis=0))
+    return intervals
+
+
+def readMisclassTable(inTable, categories):
+
+    ''' Reads misclassification table (xls) with three columns - mapped code,
+        true code and probability - to matrix k x k of the categories. Rows of
+        categories missing in the table or with zero probabilities stay
+        identity (no misclassification). '''
+
+    import arcpy
+    import numpy as np
+
+    arcpy.ExcelToTable_conversion(inTable, "memory\\misclassTable")
+    fields = [f.name for f in arcpy.ListFields("memory\\misclassTable") if f.type != "OID"][:3]
+
+    categoryIndex = {code: i for i, code in enumerate(categories)}
+    matrix = np.eye(len(categories))
+    rows = set()
+    with arcpy.da.SearchCursor("memory\\misclassTable", fields) as cursor:
+        for row in cursor:
+            # numeric codes are read from Excel as float (e.g. 112.0)
+            mapped, true = [str(int(v)) if isinstance(v, float) and v.is_integer() else str(v)
+                            for v in row[:2]]
+            if mapped not in categoryIndex or true not in categoryIndex:
+                continue
+            i = categoryIndex[mapped]
+            if i not in rows:
+                matrix[i] = 0
+                rows.add(i)
+            matrix[i, categoryIndex[true]] = float(row[2])
+
+    # rows are probabilities - normalise to sum 1
+    sums = matrix.sum(axis=1)
+    for i in np.flatnonzero(sums <= 0):
+        arcpy.AddWarning("Probabilities of category {} in misclassification table sum to zero "
+                         "- category is taken as correctly classified".format(categories[i]))
+        matrix[i] = 0
+        matrix[i, i] = 1
+        sums[i] = 1
+    return matrix / sums[:, None]
@@ -0,0 +1,165 @@
+# ChangeDetection toolbox
+# Validation of input land cover layers before detection of changes
+# Lukas Zubrietovsky, Hana Bobalova
+
+
+def buildGridIndex(extents):
+
+    ''' Builds a simple spatial index - a regular grid of cells with a list of
+        features whose extent falls into the cell. Cell size is chosen to hold
+        about one feature per cell on average. '''
+
+    import math
+
+    xMin = min(e[0] for e in extents)
+    yMin = min(e[1] for e in extents)
+    xMax = max(e[2] for e in extents)
+    yMax = max(e[3] for e in extents)
+    cellSize = math.sqrt(((xMax - xMin) * (yMax - yMin)) / len(extents))
+    if cellSize <= 0:
+        cellSize = max(xMax - xMin, yMax - yMin, 1.0)
+
+    grid = {}
+    for i in range(len(extents)):
+        e = extents[i]
+        for col in range(int((e[0] - xMin) // cellSize), int((e[2] - xMin) // cellSize) + 1):
+            for row in range(int((e[1] - yMin) // cellSize), int((e[3] - yMin) // cellSize) + 1):
+                grid.setdefault((col, row), []).append(i)
+    return grid
+
+
+def isSliver(geometry, tolerance, xyTolerance, unit):
+
+    ''' Returns True if geometry (overlap or gap) is negligible - its area in
+        unit is up to tolerance or its mean width (2 * area / perimeter) is up
+        to XY tolerance of the data, i.e. it is a slit between two boundaries
+        which differ only within XY tolerance. '''
+
+    if geometry.getArea("PLANAR", unit) <= tolerance:
+        return True
+    return geometry.length > 0 and 2 * geometry.area / geometry.length <= xyTolerance
+
+
+def findOverlaps(geometries, tolerance, xyTolerance, unit):
+
+    ''' Finds pairs of features which overlap by more than tolerance (area in
+        unit, see isSliver). Only pairs sharing a grid cell with intersecting
+        extents are compared in detail. '''
+
+    extents = [(g.extent.XMin, g.extent.YMin, g.extent.XMax, g.extent.YMax) for g in geometries]
+    grid = buildGridIndex(extents)
+
+    overlaps = []   # list of (index1, index2, area of overlap)
+    checked = set()
+    for cell in grid.values():
+        for a in range(len(cell)):
+            for b in range(a + 1, len(cell)):
+                i, j = cell[a], cell[b]
+                if (i, j) in checked:
+                    continue
+                checked.add((i, j))
+                e1, e2 = extents[i], extents[j]
+                if e1[0] >= e2[2] or e2[0] >= e1[2] or e1[1] >= e2[3] or e2[1] >= e1[3]:
+                    continue
+                g1, g2 = geometries[i], geometries[j]
+                if g1.disjoint(g2) or g1.touches(g2):
+                    continue
+                overlap = g1.intersect(g2, 4)
+                if not isSliver(overlap, tolerance, xyTolerance, unit):
+                    overlaps.append((i, j, overlap.getArea("PLANAR", unit)))
+    return overlaps
+
+
+def findGaps(inFC, tolerance, xyTolerance, unit):
+
+    ''' Finds gaps (holes) inside the area covered by the layer - Union of the
+        dissolved layer without gaps (NO_GAPS) fills the holes with new
+        features (FID -1), only these are checked by isSliver. Returns count
+        and area in unit. '''
+
+    import arcpy
+
+    arcpy.analysis.PairwiseDissolve(inFC, "memory\\validationFC")
+    arcpy.Union_analysis(["memory\\validationFC"], "memory\\gapFC", "ONLY_FID", gaps="NO_GAPS")
+    whereClause = "{} = -1".format(arcpy.AddFieldDelimiters("memory\\gapFC", "FID_validationFC"))
+    count = 0
+    area = 0.0
+    with arcpy.da.SearchCursor("memory\\gapFC", "SHAPE@", whereClause) as cursor:
+        for row in cursor:
+            if row[0] is None or isSliver(row[0], tolerance, xyTolerance, unit):
+                continue
+            count += 1
+            area += row[0].getArea("PLANAR", unit)
+    arcpy.Delete_management("memory\\validationFC")
+    arcpy.Delete_management("memory\\gapFC")
+    return count, area
+
+
+def checkLayer(inFC, fieldCode, tolerance, unit, report):
+
+    ''' Checks one input layer - codes, overlaps and gaps. Problems are added
+        to the report. Returns total area of features in unit. '''
+
+    import arcpy
+
+    name = inFC.rsplit("\\", 1)[-1]
+    xyTolerance = arcpy.Describe(inFC).spatialReference.XYTolerance or 0.0
+    oids = []
+    geometries = []
+    badCodes = {}
+    with arcpy.da.SearchCursor(inFC, ["OID@", "SHAPE@", fieldCode]) as cursor:
+        for row in cursor:
+            code = row[2]
+            if code is None or str(code).strip() == "" or "_" in str(code) or str(code) != str(code).strip():
+                badCodes[row[0]] = code
+            if row[1] is None:
+                continue
+            oids.append(row[0])
+            geometries.append(row[1])
+
+    totalArea = sum(g.getArea("PLANAR", unit) for g in geometries)
+
+    if badCodes:
+        examples = ", ".join("{} ({!r})".format(oid, code) for oid, code in list(badCodes.items())[:5])
+        report.append("{}: {} features with empty code or code containing '_', e.g. OID {}".format(
+            name, len(badCodes), examples))
+
+    if geometries:
+        overlaps = findOverlaps(geometries, tolerance, xyTolerance, unit)
+        if overlaps:
+            examples = ", ".join("{}/{}".format(oids[i], oids[j]) for i, j, area in overlaps[:5])
+            report.append("{}: {} overlapping pairs of features, area {:.2f}, e.g. OID {}".format(
+                name, len(overlaps), sum(o[2] for o in overlaps), examples))
+
+        gapCount, gapArea = findGaps(inFC, tolerance, xyTolerance, unit)
+        if gapCount:
+            report.append("{}: {} gaps between features, area {:.2f}".format(name, gapCount, gapArea))
+
+    return totalArea
+
+
+def validateInputs(inFC1, fieldCode1, inFC2, fieldCode2, tolerance=0.0, maxAreaDiff=0.001,
+                   areaUnit="Square meters"):
+
+    ''' Validates both input LC layers before detection of changes - checks for
+        overlaps and gaps between features, codes which are empty or contain '_'
+        and difference of total areas of both periods (relative, maxAreaDiff).
+        Overlaps and gaps up to tolerance (area in areaUnit) or thinner than XY
+        tolerance of the data are ignored. Returns a list of problems, which is
+        empty if inputs are valid. '''
+
+    dictionary = {"Ares":"ARES", "Hectares":"HECTARES", "Square meters":"SQUAREMETERS","Square kilometers":"SQUAREKILOMETERS"}
+    unit = dictionary[areaUnit]
+    tolerance = float(tolerance)
+
+    report = []
+    totalArea1 = checkLayer(inFC1, fieldCode1, tolerance, unit, report)
+    totalArea2 = checkLayer(inFC2, fieldCode2, tolerance, unit, report)
+
+    if max(totalArea1, totalArea2) > 0:
+        diff = abs(totalArea1 - totalArea2) / max(totalArea1, totalArea2)
+        if diff > maxAreaDiff:
+            report.append("Total areas of both periods differ by {:.2f} % ({:.2f} and {:.2f})".format(
+                diff * 100, totalArea1, totalArea2))
+
+    return report